@@ -14,13 +14,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import asyncio
 import mimetypes
 import os
 import re
 import shutil
+import threading
+import traceback
+from contextlib import asynccontextmanager
 from typing import Optional
 import datetime
-import pytz
+import functools
 
 from smolagents.agent_types import (
     AgentAudio,
@@ -30,59 +34,93 @@ from smolagents.agent_types import (
 )
 from smolagents.agents import ActionStep, MultiStepAgent
 from smolagents.memory import MemoryStep
-from smolagents.utils import _is_package_available
 
-
-def get_current_time_in_timezone(timezone: str) -> str:
-    """A tool that fetches the current local time in a specified timezone.
-    Args:
-        timezone: A string representing a valid timezone (e.g., 'America/New_York').
-    """
-    try:
-        # Create timezone object
-        tz = pytz.timezone(timezone)
-        # Get current time in that timezone
-        local_time = datetime.datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
-        return f"The current local time in {timezone} is: {local_time}"
-    except Exception as e:
-        return f"Error fetching time for timezone '{timezone}': {str(e)}"
+try:
+    import gradio as gr
+except ImportError:
+    gr = None
+    _assistant_msg = None
+else:
+    _assistant_msg = functools.partial(gr.ChatMessage, role="assistant")
+
+# Patterns used to clean up model output and tool call content
+# handles ```<end_code>, ```\n<end_code> and <end_code>``` in a single pass. Matches don't overlap,
+# so a fence with a tag on both sides (<end_code>```<end_code>) only loses the first tag.
+_RE_END_CODE_ANY = re.compile(r"```\s*<end_code>|<end_code>\s*```")
+_RE_STRIP_CODEBLOCK = re.compile(r"```.*?\n")
+# Any non-alphanumeric, non-dash, or non-dot character in uploaded file names
+_RE_SANITIZE = re.compile(r"[^\w\-.]")
+
+# Time in seconds streamed messages are collected for before they are sent to the UI together
+_FLUSH_INTERVAL = 0.025
+# Marks the end of the messages put on an agent stream queue
+_STREAM_END = object()
+
+
+def get_current_local_time() -> str:
+    """Returns the current time in the host's local timezone, formatted for the time display."""
+    # astimezone() uses the host's zone directly, no lookup by (ambiguous) abbreviation needed
+    local_now = datetime.datetime.now().astimezone()
+    local_time = local_now.strftime("%Y-%m-%d %H:%M:%S")
+    return f"The current local time in {local_now.tzname()} is: {local_time}"
+
+
+def _tick_local_time(last_time: str):
+    """Timer handler for the time display, skips the update if the shown time is still current."""
+    current_time = get_current_local_time()
+    if current_time == last_time:
+        return gr.update(), last_time
+    return current_time, current_time
+
+
+@functools.cache
+def _type_to_ext() -> dict:
+    """Reverse mapping of mime type to its first registered extension, built once from the full mimetypes table."""
+    # mimetypes.init() replaces types_map with the system tables, which e.g. add .docx
+    if not mimetypes.inited:
+        mimetypes.init()
+    type_to_ext = {}
+    for ext, t in mimetypes.types_map.items():
+        type_to_ext.setdefault(t, ext)
+    return type_to_ext
 
 
 def pull_messages_from_step(
     step_log: MemoryStep,
 ):
     """Extract ChatMessage objects from agent steps with proper nesting"""
-    import gradio as gr
+    if gr is None:
+        raise ModuleNotFoundError(
+            "Please install 'gradio' extra to use the GradioUI: `pip install 'smolagents[gradio]'`"
+        )
 
     if isinstance(step_log, ActionStep):
         # Output the step number
         step_number = (
             f"Step {step_log.step_number}" if step_log.step_number is not None else ""
         )
-        yield gr.ChatMessage(role="assistant", content=f"**{step_number}**")
+        yield _assistant_msg(content=f"**{step_number}**")
+
+        # Look the fields up once; steps without output, tool calls or errors go straight to the footnote
+        model_output = getattr(step_log, "model_output", None)
+        tool_calls = getattr(step_log, "tool_calls", None)
+        error = getattr(step_log, "error", None)
+        observations = getattr(step_log, "observations", None)
+        input_token_count = getattr(step_log, "input_token_count", None)
+        output_token_count = getattr(step_log, "output_token_count", None)
+        duration = getattr(step_log, "duration", None)
 
         # First yield the thought/reasoning from the LLM
-        if hasattr(step_log, "model_output") and step_log.model_output is not None:
-            # Clean up the LLM output
-            model_output = step_log.model_output.strip()
-            # Remove any trailing <end_code> and extra backticks, handling multiple possible formats
-            model_output = re.sub(
-                r"```\s*<end_code>", "```", model_output
-            )  # handles ```<end_code>
-            model_output = re.sub(
-                r"<end_code>\s*```", "```", model_output
-            )  # handles <end_code>```
-            model_output = re.sub(
-                r"```\s*\n\s*<end_code>", "```", model_output
-            )  # handles ```\n<end_code>
-            model_output = model_output.strip()
-            yield gr.ChatMessage(role="assistant", content=model_output)
+        if model_output is not None:
+            # Clean up the LLM output, removing any trailing <end_code> and extra backticks
+            model_output = _RE_END_CODE_ANY.sub("```", model_output).strip()
+            yield _assistant_msg(content=model_output)
 
         # For tool calls, create a parent message
-        if hasattr(step_log, "tool_calls") and step_log.tool_calls is not None:
-            first_tool_call = step_log.tool_calls[0]
+        if tool_calls is not None:
+            first_tool_call = tool_calls[0]
             used_code = first_tool_call.name == "python_interpreter"
-            parent_id = f"call_{len(step_log.tool_calls)}"
+            parent_id = f"call_{len(tool_calls)}"
 
             # Tool call becomes the parent message with timing info
             # First we will handle arguments based on type
@@ -94,18 +132,17 @@ def pull_messages_from_step(
 
             if used_code:
                 # Clean up the content by removing any end code tags
-                content = re.sub(
-                    r"```.*?\n", "", content
-                )  # Remove existing code blocks
-                content = re.sub(
-                    r"\s*<end_code>\s*", "", content
-                )  # Remove end_code tags
-                content = content.strip()
+                if "```" in content:
+                    content = _RE_STRIP_CODEBLOCK.sub(
+                        "", content
+                    )  # Remove existing code blocks
+                content = content.replace(
+                    "<end_code>", ""
+                ).strip()  # Remove end_code tags
                 if not content.startswith("```python"):
                     content = f"```python\n{content}\n```"
 
-            parent_message_tool = gr.ChatMessage(
-                role="assistant",
+            parent_message_tool = _assistant_msg(
                 content=content,
                 metadata={
                     "title": f"🛠️ Used tool {first_tool_call.name}",
@@ -116,27 +153,22 @@ def pull_messages_from_step(
             yield parent_message_tool
 
             # Nesting execution logs under the tool call if they exist
-            if hasattr(step_log, "observations") and (
-                step_log.observations is not None and step_log.observations.strip()
-            ):  # Only yield execution logs if there's actual content
-                log_content = step_log.observations.strip()
-                if log_content:
-                    log_content = re.sub(r"^Execution logs:\s*", "", log_content)
-                    yield gr.ChatMessage(
-                        role="assistant",
-                        content=f"{log_content}",
-                        metadata={
-                            "title": "📝 Execution Logs",
-                            "parent_id": parent_id,
-                            "status": "done",
-                        },
-                    )
+            log_content = (observations or "").strip()
+            if log_content:  # Only yield execution logs if there's actual content
+                log_content = log_content.removeprefix("Execution logs:").lstrip()
+                yield _assistant_msg(
+                    content=f"{log_content}",
+                    metadata={
+                        "title": "📝 Execution Logs",
+                        "parent_id": parent_id,
+                        "status": "done",
+                    },
+                )
 
             # Nesting any errors under the tool call
-            if hasattr(step_log, "error") and step_log.error is not None:
-                yield gr.ChatMessage(
-                    role="assistant",
-                    content=str(step_log.error),
+            if error is not None:
+                yield _assistant_msg(
+                    content=str(error),
                     metadata={
                         "title": "💥 Error",
                         "parent_id": parent_id,
@@ -148,30 +180,23 @@ def pull_messages_from_step(
             parent_message_tool.metadata["status"] = "done"
 
         # Handle standalone errors but not from tool calls
-        elif hasattr(step_log, "error") and step_log.error is not None:
-            yield gr.ChatMessage(
-                role="assistant",
-                content=str(step_log.error),
+        elif error is not None:
+            yield _assistant_msg(
+                content=str(error),
                 metadata={"title": "💥 Error"},
             )
 
         # Calculate duration and token information
-        step_footnote = f"{step_number}"
-        if hasattr(step_log, "input_token_count") and hasattr(
-            step_log, "output_token_count"
-        ):
-            token_str = f" | Input-tokens:{step_log.input_token_count:,} | Output-tokens:{step_log.output_token_count:,}"
-            step_footnote += token_str
-        if hasattr(step_log, "duration"):
-            step_duration = (
-                f" | Duration: {round(float(step_log.duration), 2)}"
-                if step_log.duration
-                else None
-            )
-            step_footnote += step_duration
+        footnote_parts = [step_number]
+        if input_token_count is not None and output_token_count is not None:
+            token_str = f" | Input-tokens:{input_token_count:,} | Output-tokens:{output_token_count:,}"
+            footnote_parts.append(token_str)
+        if duration:
+            footnote_parts.append(f" | Duration: {duration:.2f}")
+        step_footnote = "".join(footnote_parts)
         step_footnote = f"""<span style="color: #bbbbc2; font-size: 12px;">{step_footnote}</span> """
-        yield gr.ChatMessage(role="assistant", content=f"{step_footnote}")
-        yield gr.ChatMessage(role="assistant", content="-----")
+        yield _assistant_msg(content=f"{step_footnote}")
+        yield _assistant_msg(content="-----")
 
 
 def stream_to_gradio(
@@ -181,11 +206,10 @@ def stream_to_gradio(
     additional_args: Optional[dict] = None,
 ):
     """Runs an agent with the given task and streams the messages from the agent as gradio ChatMessages."""
-    if not _is_package_available("gradio"):
+    if gr is None:
         raise ModuleNotFoundError(
             "Please install 'gradio' extra to use the GradioUI: `pip install 'smolagents[gradio]'`"
         )
-    import gradio as gr
 
     total_input_tokens = 0
     total_output_tokens = 0
@@ -210,31 +234,114 @@ def stream_to_gradio(
     final_answer = handle_agent_output_types(final_answer)
 
     if isinstance(final_answer, AgentText):
-        yield gr.ChatMessage(
-            role="assistant",
+        yield _assistant_msg(
             content=f"**Final answer:**\n{final_answer.to_string()}\n",
         )
     elif isinstance(final_answer, AgentImage):
-        yield gr.ChatMessage(
-            role="assistant",
+        yield _assistant_msg(
             content={"path": final_answer.to_string(), "mime_type": "image/png"},
         )
     elif isinstance(final_answer, AgentAudio):
-        yield gr.ChatMessage(
-            role="assistant",
+        yield _assistant_msg(
             content={"path": final_answer.to_string(), "mime_type": "audio/wav"},
         )
     else:
-        yield gr.ChatMessage(
-            role="assistant", content=f"**Final answer:** {str(final_answer)}"
+        yield _assistant_msg(content=f"**Final answer:** {str(final_answer)}")
+
+
+def _log_worker_error(future: asyncio.Future):
+    """Done callback for an abandoned worker: retrieves and prints its exception, if any."""
+    if not future.cancelled() and future.exception() is not None:
+        traceback.print_exception(future.exception())
+
+
+@asynccontextmanager
+async def _agent_stream(
+    agent,
+    task: str,
+    reset_agent_memory: bool = False,
+    additional_args: Optional[dict] = None,
+):
+    """Runs `stream_to_gradio` on a worker thread and provides the queue its messages are put on,
+    followed by `_STREAM_END`. Leaving the context early stops the agent run at its next message.
+
+    Gradio already runs sync generators off the event loop; the thread and queue are here so the
+    consumer can stop the run early and batch messages, not to unblock the loop."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def produce():
+        messages = stream_to_gradio(
+            agent,
+            task=task,
+            reset_agent_memory=reset_agent_memory,
+            additional_args=additional_args,
+        )
+        try:
+            for message in messages:
+                loop.call_soon_threadsafe(queue.put_nowait, message)
+                if stop.is_set():
+                    # Nobody is consuming anymore, close the run instead of finishing it
+                    messages.close()
+                    break
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, _STREAM_END)
+
+    producer = asyncio.ensure_future(asyncio.to_thread(produce))
+    finished = False
+    try:
+        yield queue
+        finished = True
+    finally:
+        stop.set()
+        if not finished:
+            # Nobody awaits the worker anymore, still report what it raised
+            producer.add_done_callback(_log_worker_error)
+    await producer  # re-raises any error from the agent run
+
+
+async def _next_batch(queue: asyncio.Queue):
+    """Waits for the next message on `queue` and collects everything that follows within `_FLUSH_INTERVAL`.
+    Returns the batch and whether the end of the stream was reached."""
+    loop = asyncio.get_running_loop()
+    message = await queue.get()
+    deadline = loop.time() + _FLUSH_INTERVAL
+    batch = []
+    while message is not _STREAM_END:
+        batch.append(message)
+        try:
+            message = await asyncio.wait_for(
+                queue.get(), max(deadline - loop.time(), 0)
+            )
+        except asyncio.TimeoutError:
+            return batch, False
+    return batch, True
+
+
+async def stream_to_gradio_async(
+    agent,
+    task: str,
+    reset_agent_memory: bool = False,
+    additional_args: Optional[dict] = None,
+):
+    """Async version of `stream_to_gradio`, yielding each message as soon as the agent produces it.
+    Closing this generator stops the agent run at its next message."""
+    if gr is None:
+        raise ModuleNotFoundError(
+            "Please install 'gradio' extra to use the GradioUI: `pip install 'smolagents[gradio]'`"
         )
 
+    async with _agent_stream(agent, task, reset_agent_memory, additional_args) as queue:
+        while (message := await queue.get()) is not _STREAM_END:
+            yield message
+
 
 class GradioUI:
     """A one-line interface to launch your agent in Gradio"""
 
     def __init__(self, agent: MultiStepAgent, file_upload_folder: str | None = None):
-        if not _is_package_available("gradio"):
+        if gr is None:
             raise ModuleNotFoundError(
                 "Please install 'gradio' extra to use the GradioUI: `pip install 'smolagents[gradio]'`"
             )
@@ -244,18 +351,27 @@ class GradioUI:
             if not os.path.exists(file_upload_folder):
                 os.mkdir(file_upload_folder)
 
-    def interact_with_agent(self, prompt, messages):
-        import gradio as gr
-
-        try: 
+    async def interact_with_agent(self, prompt, messages):
+        # `messages` is extended in place and the same list is yielded every time:
+        # Gradio diffs successive outputs of a generator, so only new messages
+        # (and the parent status updates) are sent to the Chatbot.
+        try:
             messages.append(gr.ChatMessage(role="user", content=prompt))
             yield messages
-            for msg in stream_to_gradio(self.agent, task=prompt, reset_agent_memory=False):
-                messages.append(msg)
-                yield messages
-            yield messages   
-        except:
-            raise gr.Error("Due to the high demand for Your Cyberpunk Local Time Terminal, the space has run out of computing credits. The technician has been notified. Please try again later. You can sponsor the project at github.com/sponsors/crcdng. Thank you for your patience.")
+            # Leaving the context (also when Gradio closes this generator) stops the agent run
+            async with _agent_stream(
+                self.agent, task=prompt, reset_agent_memory=False
+            ) as queue:
+                ended = False
+                while not ended:
+                    batch, ended = await _next_batch(queue)
+                    if batch:
+                        messages.extend(batch)
+                        yield messages
+        except Exception:
+            # Keep the real cause in the logs, the user only sees the generic message below
+            traceback.print_exc()
+            raise gr.Error("Due to the high demand for Your Cyberpunk Local Time Terminal, the space has run out of computing credits. The technician has been notified. Please try again later. You can sponsor the project at github.com/sponsors/crcdng. Thank you for your patience.") from None
 
     def upload_file(
         self,
@@ -270,8 +386,6 @@ class GradioUI:
         """
         Handle file uploads, default allowed types are .pdf, .docx, and .txt
         """
-        import gradio as gr
-
         if file is None:
             return gr.Textbox("No file uploaded", visible=True), file_uploads_log
 
@@ -285,25 +399,19 @@ class GradioUI:
 
         # Sanitize file name
         original_name = os.path.basename(file.name)
-        sanitized_name = re.sub(
-            r"[^\w\-.]", "_", original_name
+        sanitized_name = _RE_SANITIZE.sub(
+            "_", original_name
         )  # Replace any non-alphanumeric, non-dash, or non-dot characters with underscores
 
-        type_to_ext = {}
-        for ext, t in mimetypes.types_map.items():
-            if t not in type_to_ext:
-                type_to_ext[t] = ext
-
         # Ensure the extension correlates to the mime type
-        sanitized_name = sanitized_name.split(".")[:-1]
-        sanitized_name.append("" + type_to_ext[mime_type])
-        sanitized_name = "".join(sanitized_name)
+        root, _ = os.path.splitext(sanitized_name)
+        sanitized_name = root + _type_to_ext()[mime_type]
 
         # Save the uploaded file to the specified folder
-        file_path = os.path.join(
-            self.file_upload_folder, os.path.basename(sanitized_name)
-        )
-        shutil.copy(file.name, file_path)
+        file_path = os.path.join(self.file_upload_folder, sanitized_name)
+        # copyfile uses the OS fast-copy path (sendfile / fcopyfile) where available
+        if not (os.path.exists(file_path) and os.path.samefile(file.name, file_path)):
+            shutil.copyfile(file.name, file_path)
 
         return gr.Textbox(
             f"File uploaded: {file_path}", visible=True
@@ -334,8 +442,6 @@ class GradioUI:
         self.agent.max_steps = steps
 
     def launch(self, **kwargs):
-        import gradio as gr
-
         with gr.Blocks(
             fill_height=True,
             theme="crcdng/cyber",
@@ -377,11 +483,11 @@ class GradioUI:
                 gr.Textbox(render=False)
                 time_display = gr.Textbox(label="Time", elem_classes="cyber-glitch-4")
                 gr.Textbox(render=False)
-                import time
-
+                last_time = gr.State("")
                 timer.tick(
-                    lambda: get_current_time_in_timezone(time.tzname[0]),
-                    outputs=time_display,
+                    _tick_local_time,
+                    inputs=last_time,
+                    outputs=[time_display, last_time],
                 )
             with gr.Row():
                 title = gr.HTML(title_html)
@@ -394,8 +500,8 @@ class GradioUI:
                     label="Agent",
                     type="messages",
                     avatar_images=(
-                        "https://huggingface.co/spaces/crcdng/First_agent_template/resolve/main/agent_b.jpg",
-                        "https://huggingface.co/spaces/crcdng/First_agent_template/resolve/main/agent_a.jpg",
+                        "assets/agent_b.jpg",
+                        "assets/agent_a.jpg",
                     ),
                     resizeable=True,
                     scale=2,
@@ -465,9 +571,9 @@ class GradioUI:
             debug=True,
             share=True,
             ssr_mode=False,
-            allowed_paths=["Cyberpunk.otf"],
+            allowed_paths=["Cyberpunk.otf", "assets/"],
             **kwargs,
         )
 
 
-__all__ = ["stream_to_gradio", "GradioUI"]
+__all__ = ["stream_to_gradio", "stream_to_gradio_async", "GradioUI"]
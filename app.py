@@ -1,7 +1,7 @@
 from smolagents import CodeAgent, DuckDuckGoSearchTool, HfApiModel, load_tool, tool
 import datetime
 import requests
-import pytz
+from zoneinfo import ZoneInfo
 import yaml
 from tools.final_answer import FinalAnswerTool
 
@@ -15,7 +15,7 @@ def get_current_time_in_timezone(timezone: str) -> str:
     """
     try:
         # Create timezone object
-        tz = pytz.timezone(timezone)
+        tz = ZoneInfo(timezone)
         # Get current time in that timezone
         local_time = datetime.datetime.now(tz).strftime("%Y-%m-%d %H:%M:%S")
         return f"The current local time in {timezone} is: {local_time}"
@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip("smolagents")
+
+from Gradio_UI import _RE_END_CODE_ANY
+
+
+@pytest.mark.parametrize(
+    "model_output, expected",
+    [
+        ("print(1)\n```<end_code>", "print(1)\n```"),  # ```<end_code>
+        ("print(1)\n```\n<end_code>", "print(1)\n```"),  # ```\n<end_code>
+        ("print(1)\n<end_code>```", "print(1)\n```"),  # <end_code>```
+        # Matches don't overlap, so only the first tag around the fence is removed
+        ("<end_code>```<end_code>", "```<end_code>"),
+    ],
+)
+def test_end_code_cleanup(model_output, expected):
+    assert _RE_END_CODE_ANY.sub("```", model_output) == expected